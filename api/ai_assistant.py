@@ -4,84 +4,279 @@ Provides intelligent assistance for EJV calculations and store analysis
 """
 
 import os
-from flask import jsonify, request
-from openai import OpenAI
-from anthropic import Anthropic
+import hashlib
+import logging
+import secrets
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+import orjson
+from flask import Response, request
 from dotenv import load_dotenv
+from llm_cache import (SemanticCache, hash_context, is_standalone, record_exchange,
+                       get_recent_turns, hash_conversation)
+from rate_limiter import TokenBucket, estimate_tokens
+import batch_recommendations
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
-# Initialize AI clients
-openai_client = None
-anthropic_client = None
+# AI clients are created on first use so cold starts (and /api/ai/status)
+# don't pay for importing the provider SDKs
+def _pooled_http_client(sdk):
+    """
+    Return a pooled HTTP/2 client for one provider SDK module.
+
+    Keeping one pool per SDK across Flask worker threads reuses TCP/TLS
+    connections (and multiplexes streams over HTTP/2) instead of reconnecting.
+    The client is built from the SDK's own DefaultHttpxClient, Limits and
+    Timeout types because SDK releases differ in the HTTP package they accept
+    (newer ones reject a plain httpx.Client in favour of httpx2).
+    """
+    limits_type = type(sdk.DEFAULT_CONNECTION_LIMITS)
+    return sdk.DefaultHttpxClient(
+        http2=True,
+        limits=limits_type(max_keepalive_connections=32, max_connections=64),
+        timeout=sdk.Timeout(30.0, connect=5.0)
+    )
 
-try:
+
+@lru_cache(maxsize=None)
+def get_openai_client():
+    """Return the shared OpenAI client, or None if not configured"""
     openai_api_key = os.getenv('OPENAI_API_KEY')
-    if openai_api_key:
-        openai_client = OpenAI(api_key=openai_api_key)
-except Exception as e:
-    print(f"OpenAI initialization error: {e}")
+    if not openai_api_key:
+        return None
+    # Construction errors propagate (and are retried next call) rather than
+    # silently disabling the provider
+    import openai
+    return openai.OpenAI(api_key=openai_api_key, http_client=_pooled_http_client(openai))
+
 
-try:
+@lru_cache(maxsize=None)
+def get_anthropic_client():
+    """Return the shared Claude client, or None if not configured"""
     claude_api_key = os.getenv('CLAUDE_API_KEY')
-    if claude_api_key:
-        anthropic_client = Anthropic(api_key=claude_api_key)
-except Exception as e:
-    print(f"Claude initialization error: {e}")
+    if not claude_api_key:
+        return None
+    import anthropic
+    return anthropic.Anthropic(api_key=claude_api_key, http_client=_pooled_http_client(anthropic))
+
+
+def get_embedding(text):
+    """Embed text with OpenAI for semantic cache lookups (within the OpenAI rate limits)"""
+    openai_bucket.acquire(estimate_tokens(text, 0))
+    with _llm_slot():
+        response = get_openai_client().embeddings.create(
+            model="text-embedding-3-small",
+            input=text
+        )
+    return response.data[0].embedding
+
+
+# Semantic response cache (needs OpenAI for embeddings)
+semantic_cache = SemanticCache(get_embedding) if os.getenv('OPENAI_API_KEY') else None
+
+
+def json_response(payload, status=200):
+    """JSON response serialized with orjson (bytes straight to the body)"""
+    return Response(orjson.dumps(payload), status=status, mimetype='application/json')
+
+
+def request_json():
+    """Parse the request body with orjson ({} for an empty body, None unless it is a JSON object)"""
+    body = request.get_data()
+    if not body:
+        return {}
+    try:
+        data = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def sse_event(payload):
+    """Encode one SSE data event"""
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
 
 
 def ai_assistant():
-    """Handle AI assistant chat requests"""
+    """Handle AI assistant chat requests (SSE-streamed when ?stream=true)"""
     try:
-        data = request.json
+        data = request_json()
+        if data is None:
+            return json_response({'error': 'Request body must be a JSON object'}, 400)
         user_message = data.get('message', '')
-        context = data.get('context', {})  # Store data, EJV scores, etc.
+        context = data.get('context') or {}  # Store data, EJV scores, etc.
         provider = data.get('provider', 'openai')  # 'openai' or 'claude'
+        if not isinstance(user_message, str) or not isinstance(context, dict):
+            return json_response({'error': 'message must be a string and context an object'}, 400)
+        stream = request.args.get('stream', '').lower() == 'true'
         
-        print(f"AI Assistant: Received message: {user_message[:50]}...")
-        print(f"AI Assistant: Provider: {provider}")
-        print(f"AI Assistant: OpenAI client available: {openai_client is not None}")
-        print(f"AI Assistant: Claude client available: {anthropic_client is not None}")
+        # Conversation the message belongs to; start a new one if none (or an invalid id) is given
+        conversation_id = data.get('conversation_id')
+        if not isinstance(conversation_id, str) or not 0 < len(conversation_id) <= 64:
+            conversation_id = secrets.token_urlsafe(16)
         
-        if not user_message:
-            return jsonify({'error': 'Message is required'}), 400
+        logger.debug("AI Assistant: Received message: %s...", user_message[:50])
+        logger.debug("AI Assistant: Provider: %s", provider)
+        logger.debug("AI Assistant: OpenAI configured: %s", bool(os.getenv('OPENAI_API_KEY')))
+        logger.debug("AI Assistant: Claude configured: %s", bool(os.getenv('CLAUDE_API_KEY')))
         
-        # Build system prompt with context
-        system_prompt = build_system_prompt(context)
+        if not user_message:
+            return json_response({'error': 'Message is required'}, 400)
         
-        # Get AI response based on provider
-        if provider == 'claude' and anthropic_client:
-            response_text = get_claude_response(system_prompt, user_message)
-        elif openai_client:
-            response_text = get_openai_response(system_prompt, user_message)
+        # Pick provider (falling back to OpenAI when Claude is unavailable)
+        if provider == 'claude' and get_anthropic_client():
+            get_response, stream_response = get_claude_response, stream_claude_response
+        elif get_openai_client():
+            provider = 'openai'
+            get_response, stream_response = get_openai_response, stream_openai_response
         else:
             error_msg = 'No AI provider available. '
-            if not openai_client:
+            if not get_openai_client():
                 error_msg += 'OpenAI client not initialized (check OPENAI_API_KEY). '
-            if not anthropic_client:
+            if not get_anthropic_client():
                 error_msg += 'Claude client not initialized (check CLAUDE_API_KEY).'
-            return jsonify({'error': error_msg}), 503
+            return json_response({'error': error_msg}, 503)
+        
+        # Static system prompt plus a separate per-request context message
+        system_prompt = build_system_prompt()
+        context_message = build_context_message(context)
+        
+        # Every message is sent with the conversation's recent turns; only standalone
+        # questions may share cached answers across conversations
+        try:
+            history = get_recent_turns(conversation_id)
+        except Exception as e:
+            logger.warning("Conversation history error: %s", e)
+            history = ()
+        standalone = is_standalone(user_message, has_history=bool(history))
+        conv_hash = hash_conversation(history)
+        
+        # Check semantic cache for an equivalent question from the same provider in the
+        # same context and, for follow-ups, the same conversation chain; exact repeats
+        # are found by hash before paying for an embeddings call
+        context_hash = hash_context(context)
+        embedding = None
+        if semantic_cache:
+            try:
+                cached_response = semantic_cache.lookup_exact(user_message, context_hash, conv_hash,
+                                                              standalone, provider)
+                if cached_response is None:
+                    embedding = semantic_cache.embed(user_message)
+                    cached_response = semantic_cache.lookup(embedding, context_hash, conv_hash,
+                                                            standalone, provider)
+            except Exception as e:
+                logger.warning("Semantic cache lookup error: %s", e)
+                cached_response = None
+                embedding = None
+        else:
+            cached_response = None
+        
+        def finish(response_text, cache_hit=False):
+            """Cache the answer and extend the conversation chain"""
+            try:
+                if embedding is not None and not cache_hit:
+                    semantic_cache.store(embedding, user_message, context_hash, conv_hash, standalone,
+                                         response_text, provider)
+                record_exchange(conversation_id, user_message, response_text)
+            except Exception as e:
+                logger.warning("Semantic cache/conversation store error: %s", e)
+        
+        if cached_response is not None:
+            if stream:
+                return sse_response(stream_chat_events(
+                    iter([cached_response]), provider, conversation_id, cache_hit=True,
+                    on_complete=lambda text: finish(text, cache_hit=True)
+                ))
+            finish(cached_response, cache_hit=True)
+            return json_response({
+                'response': cached_response,
+                'provider': provider,
+                'conversation_id': conversation_id,
+                'cache_hit': True
+            })
         
-        return jsonify({
+        if stream:
+            chunks, release = stream_response(system_prompt, context_message, user_message,
+                                              history=history)
+            response = sse_response(stream_chat_events(chunks, provider, conversation_id, on_complete=finish))
+            # Free the provider slot even if the client disconnects before the stream starts
+            response.call_on_close(release)
+            return response
+        
+        response_text = get_response(system_prompt, context_message, user_message, history=history)
+        lru_hit = last_response_cached()
+        # Still stored semantically: the LRU is per process, the semantic cache persists
+        finish(response_text)
+        
+        return json_response({
             'response': response_text,
-            'provider': provider
+            'provider': provider,
+            'conversation_id': conversation_id,
+            'cache_hit': lru_hit
         })
         
+    except LLMBusyError as e:
+        logger.warning("AI Assistant busy: %s", e)
+        return json_response({'error': str(e)}, 503)
     except Exception as e:
-        import traceback
-        error_detail = traceback.format_exc()
-        print(f"AI Assistant error: {e}")
-        print(f"Full traceback: {error_detail}")
-        return jsonify({
+        logger.exception("AI Assistant error: %s", e)
+        return json_response({
             'error': f'AI Assistant Error: {str(e)}',
             'detail': 'Check server logs for more information'
-        }), 500
+        }, 500)
+
+
+def sse_response(events):
+    """Wrap an event generator in a text/event-stream response"""
+    return Response(events, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Stop nginx-style proxies from buffering the stream
+    })
 
 
-def build_system_prompt(context):
-    """Build system prompt with application context"""
-    base_prompt = """You are an expert AI assistant for the FIX$ GeoEquity Impact Engine. 
+def stream_chat_events(chunks, provider, conversation_id, cache_hit=False, on_complete=None):
+    """
+    Format response text chunks as SSE events.
+
+    Emits one {"delta": ...} event per chunk, then {"done": true, ...} with the
+    provider, conversation_id and cache_hit; a
+    provider failure mid-stream is reported as an {"error": ...} event.
+    on_complete receives the full response text once the stream finishes.
+    """
+    collected = []
+    try:
+        # Forward chunks at wire speed: no time.sleep()/asyncio.sleep(n) between
+        # events. A per-token "throttle" caps tokens/sec and roughly halves
+        # throughput. If this ever becomes a coroutine that must yield to the
+        # event loop, use `await asyncio.sleep(0)` and nothing longer.
+        for text in chunks:
+            collected.append(text)
+            yield sse_event({'delta': text})
+    except Exception as e:
+        logger.error("AI Assistant stream error: %s", e)
+        yield sse_event({'error': f'AI Assistant Error: {str(e)}'})
+        return
+    
+    if on_complete:
+        on_complete("".join(collected))
+    yield sse_event({
+        'done': True,
+        'provider': provider,
+        'conversation_id': conversation_id,
+        'cache_hit': cache_hit
+    })
+
+
+# Static system prompt, built once at import. It is sent byte-identical first in
+# every request so it can be a provider-side cached prefix, but both OpenAI and
+# Anthropic only cache prefixes of 1024+ tokens and this is ~260, so nothing is
+# cached (or saved on prefill) until it grows past that
+SYSTEM_PROMPT = """You are an expert AI assistant for the FIX$ GeoEquity Impact Engine. 
     
 Your role is to help users understand Economic Justice Value (EJV) calculations and make informed decisions about where to shop.
 
@@ -101,116 +296,450 @@ You can help with:
 5. Understanding participation and community engagement impact
 
 Be conversational, helpful, and focused on empowering users to make economically just purchasing decisions."""
+
+
+def build_system_prompt():
+    """
+    Return the static system prompt.
+
+    It is byte-identical across requests; per-request context goes in
+    build_context_message.
+    """
+    return SYSTEM_PROMPT
+
+
+# Context fields rendered into the context message, in order, with their labels
+CONTEXT_FIELDS = (
+    ('storeName', 'Store'),
+    ('ejv40', 'EJV 4.0 Score'),
+    ('ejv41', 'EJV 4.1 Score'),
+    ('location', 'Location'),
+)
+
+
+def build_context_message(context):
+    """Build the user-role context message sent ahead of the user's question"""
+    if not context:
+        return ""
+    
+    # Key on the fields actually rendered; the same store is viewed repeatedly.
+    # Fields and values are passed as separate arguments so typed=True keeps
+    # 1, 1.0 and True (which render differently) in separate entries
+    ctx_args = [len(context.get('stores') or ())]
+    for field, _ in CONTEXT_FIELDS:
+        if field in context:
+            ctx_args += (field, context[field])
+    try:
+        return _context_message_for(*ctx_args)
+    except TypeError:
+        # Unhashable context values (e.g. nested objects) just skip the cache
+        return _context_message_for.__wrapped__(*ctx_args)
+
+
+@lru_cache(maxsize=1024, typed=True)
+def _context_message_for(store_count, *field_values):
+    """Render a context message from the store count plus alternating field, value arguments"""
+    labels = dict(CONTEXT_FIELDS)
+    parts = ["Current Context:\n"]
+    parts.extend(f"- {labels[field]}: {value}\n"
+                 for field, value in zip(field_values[::2], field_values[1::2]))
+    if store_count > 0:
+        parts.append(f"- Number of stores in view: {store_count}\n")
+    return "".join(parts)
+
+
+# Deterministic sampling so identical prompts can be served from the LRU cache
+CACHEABLE_TEMPERATURE = 0.0
+
+OPENAI_MODEL = "gpt-4o-mini"  # Using faster, cheaper model
+CLAUDE_MODEL = "claude-3-5-sonnet-20240620"
+
+# Completion budget per call
+RESPONSE_MAX_TOKENS = 500
+
+# Proactive per-provider RPM/TPM throttling (defaults match Anthropic Tier 1; 0 = unlimited)
+openai_bucket = TokenBucket(
+    rpm=int(os.getenv('OPENAI_RPM', '40')),
+    tpm=int(os.getenv('OPENAI_TPM', '16000'))
+)
+claude_bucket = TokenBucket(
+    rpm=int(os.getenv('CLAUDE_RPM', '40')),
+    tpm=int(os.getenv('CLAUDE_TPM', '16000'))
+)
+
+# Upper bound on in-flight provider calls across Flask worker threads; set to the
+# account tier's concurrent-connection limit to avoid bursting into 429s
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+_llm_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+
+# Seconds a call waits for a free slot before the request is answered with a 503
+LLM_SLOT_TIMEOUT = float(os.getenv('LLM_SLOT_TIMEOUT', '15'))
+
+
+class LLMBusyError(Exception):
+    """No provider call slot freed up within LLM_SLOT_TIMEOUT"""
+
+
+def _acquire_llm_slot():
+    """Take one _llm_slots permit and return a callable that gives it back (once)"""
+    if not _llm_slots.acquire(timeout=LLM_SLOT_TIMEOUT):
+        raise LLMBusyError("AI Assistant is busy, please retry shortly")
+    held = [True]
     
-    # Add context if available
-    if context:
-        context_info = "\n\nCurrent Context:\n"
-        
-        if 'storeName' in context:
-            context_info += f"- Store: {context['storeName']}\n"
-        
-        if 'ejv40' in context:
-            context_info += f"- EJV 4.0 Score: {context['ejv40']}\n"
-            
-        if 'ejv41' in context:
-            context_info += f"- EJV 4.1 Score: {context['ejv41']}\n"
-            
-        if 'location' in context:
-            context_info += f"- Location: {context['location']}\n"
-            
-        if 'stores' in context and len(context['stores']) > 0:
-            context_info += f"- Number of stores in view: {len(context['stores'])}\n"
-        
-        base_prompt += context_info
+    def release():
+        try:
+            held.pop()
+        except IndexError:
+            return  # Already released
+        _llm_slots.release()
     
-    return base_prompt
+    return release
 
 
-def get_openai_response(system_prompt, user_message):
-    """Get response from OpenAI GPT"""
+@contextmanager
+def _llm_slot():
+    """Hold one _llm_slots permit for the duration of a provider call"""
+    release = _acquire_llm_slot()
     try:
-        print("Calling OpenAI API...")
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",  # Using faster, cheaper model
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ],
-            temperature=0.7,
-            max_tokens=500
-        )
-        print("OpenAI API call successful")
+        yield
+    finally:
+        release()
+
+# System prompts by hash, so the cached calls below only take short hashable keys
+_system_prompts = {}
+
+# Per-thread flag set by the cached calls below when their body runs (an LRU miss)
+_lru_calls = threading.local()
+
+
+def last_response_cached():
+    """True if this thread's last get_*_response call was served from the LRU cache"""
+    return not getattr(_lru_calls, 'miss', True)
+
+
+def _system_prompt_key(system_prompt):
+    """Hash a system prompt and remember it for the cached call"""
+    sys_hash = hashlib.blake2b(system_prompt.encode('utf-8'), digest_size=16).hexdigest()
+    _system_prompts[sys_hash] = system_prompt
+    return sys_hash
+
+
+def get_openai_response(system_prompt, context_message, user_message, temperature=CACHEABLE_TEMPERATURE,
+                        max_tokens=RESPONSE_MAX_TOKENS, json_mode=False, history=()):
+    """Get response from OpenAI GPT (identical prompts and histories are served from cache)"""
+    _lru_calls.miss = False
+    return _cached_openai(_system_prompt_key(system_prompt), context_message, user_message,
+                          round(temperature, 1), max_tokens, json_mode, tuple(history))
+
+
+def get_claude_response(system_prompt, context_message, user_message, temperature=CACHEABLE_TEMPERATURE,
+                        max_tokens=RESPONSE_MAX_TOKENS, history=()):
+    """Get response from Claude (identical prompts and histories are served from cache)"""
+    _lru_calls.miss = False
+    return _cached_claude(_system_prompt_key(system_prompt), context_message, user_message,
+                          round(temperature, 1), max_tokens, tuple(history))
+
+
+def _openai_messages(system_prompt, context_message, user_message, history=()):
+    """Build the OpenAI chat messages list (history: prior (role, content) turns)"""
+    # Unchanging system prompt first so OpenAI's automatic prefix caching can cover it
+    messages = [{"role": "system", "content": system_prompt}]
+    messages.extend({"role": role, "content": content} for role, content in history)
+    if context_message:
+        messages.append({"role": "user", "content": context_message})
+    messages.append({"role": "user", "content": user_message})
+    return messages
+
+
+def _claude_request(system_prompt, context_message, user_message, history=()):
+    """Build the Claude (system blocks, messages) pair (history: prior (role, content) turns)"""
+    # Mark the static system prompt as a cache breakpoint
+    system_blocks = [
+        {"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}
+    ]
+    messages = [{"role": role, "content": [{"type": "text", "text": content}]}
+                for role, content in history]
+    # Context block goes first in the user turn, ahead of the question
+    user_content = []
+    if context_message:
+        user_content.append({"type": "text", "text": context_message})
+    user_content.append({"type": "text", "text": user_message})
+    messages.append({"role": "user", "content": user_content})
+    return system_blocks, messages
+
+
+def _acquire_openai(messages, max_tokens=RESPONSE_MAX_TOKENS):
+    """Wait for OpenAI rate-limit budget for these messages"""
+    prompt_text = "".join(message["content"] for message in messages)
+    openai_bucket.acquire(estimate_tokens(prompt_text, max_tokens))
+
+
+def _acquire_claude(system_blocks, messages, max_tokens=RESPONSE_MAX_TOKENS):
+    """Wait for Claude rate-limit budget for this request"""
+    prompt_text = "".join(block["text"] for block in system_blocks)
+    prompt_text += "".join(block["text"] for message in messages for block in message["content"])
+    claude_bucket.acquire(estimate_tokens(prompt_text, max_tokens))
+
+
+@lru_cache(maxsize=2048)
+def _cached_openai(sys_hash, context_message, user_message, temperature, max_tokens, json_mode, history):
+    """Call OpenAI GPT; memoized on all request parameters, conversation history included"""
+    _lru_calls.miss = True
+    messages = _openai_messages(_system_prompts[sys_hash], context_message, user_message, history)
+    extra_params = {"response_format": {"type": "json_object"}} if json_mode else {}
+    try:
+        logger.debug("Calling OpenAI API...")
+        _acquire_openai(messages, max_tokens)
+        with _llm_slot():
+            response = get_openai_client().chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **extra_params
+            )
+        logger.debug("OpenAI API call successful")
         return response.choices[0].message.content
+    except LLMBusyError:
+        raise
     except Exception as e:
-        print(f"OpenAI API error details: {str(e)}")
+        logger.error("OpenAI API error details: %s", e)
         raise Exception(f"OpenAI API error: {str(e)}")
 
 
-def get_claude_response(system_prompt, user_message):
-    """Get response from Claude"""
+@lru_cache(maxsize=2048)
+def _cached_claude(sys_hash, context_message, user_message, temperature, max_tokens, history):
+    """Call Claude; memoized on all request parameters, conversation history included"""
+    _lru_calls.miss = True
+    system_blocks, messages = _claude_request(_system_prompts[sys_hash], context_message, user_message,
+                                              history)
     try:
-        print("Calling Claude API...")
-        response = anthropic_client.messages.create(
-            model="claude-3-5-sonnet-20240620",
-            max_tokens=500,
-            system=system_prompt,
-            messages=[
-                {"role": "user", "content": user_message}
-            ]
-        )
-        print("Claude API call successful")
+        logger.debug("Calling Claude API...")
+        _acquire_claude(system_blocks, messages, max_tokens)
+        with _llm_slot():
+            response = get_anthropic_client().messages.create(
+                model=CLAUDE_MODEL,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                system=system_blocks,
+                messages=messages
+            )
+        logger.debug("Claude API call successful")
         return response.content[0].text
+    except LLMBusyError:
+        raise
+    except Exception as e:
+        logger.error("Claude API error details: %s", e)
+        raise Exception(f"Claude API error: {str(e)}")
+
+
+def stream_openai_response(system_prompt, context_message, user_message, temperature=CACHEABLE_TEMPERATURE,
+                           history=()):
+    """
+    Start streaming a response from OpenAI GPT.
+
+    Rate-limit budget and an in-flight slot are taken before returning, so a
+    busy server raises LLMBusyError before any response is sent. Returns
+    (chunks, release): chunks yields response text, and release() frees the
+    slot if the consumer goes away before the stream is finished.
+    """
+    messages = _openai_messages(system_prompt, context_message, user_message, history)
+    _acquire_openai(messages)
+    release = _acquire_llm_slot()
+    return _openai_chunks(messages, temperature, release), release
+
+
+def _openai_chunks(messages, temperature, release):
+    """Yield OpenAI GPT response text, releasing the slot when the stream ends"""
+    try:
+        logger.debug("Streaming OpenAI API...")
+        stream = get_openai_client().chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=RESPONSE_MAX_TOKENS,
+            stream=True
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+        logger.debug("OpenAI API stream complete")
+    except Exception as e:
+        logger.error("OpenAI API error details: %s", e)
+        raise Exception(f"OpenAI API error: {str(e)}")
+    finally:
+        release()
+
+
+def stream_claude_response(system_prompt, context_message, user_message, temperature=CACHEABLE_TEMPERATURE,
+                           history=()):
+    """Start streaming a response from Claude (see stream_openai_response)"""
+    system_blocks, messages = _claude_request(system_prompt, context_message, user_message, history)
+    _acquire_claude(system_blocks, messages)
+    release = _acquire_llm_slot()
+    return _claude_chunks(system_blocks, messages, temperature, release), release
+
+
+def _claude_chunks(system_blocks, messages, temperature, release):
+    """Yield Claude response text, releasing the slot when the stream ends"""
+    try:
+        logger.debug("Streaming Claude API...")
+        with get_anthropic_client().messages.stream(
+            model=CLAUDE_MODEL,
+            max_tokens=RESPONSE_MAX_TOKENS,
+            temperature=temperature,
+            system=system_blocks,
+            messages=messages
+        ) as stream:
+            for text in stream.text_stream:
+                yield text
+        logger.debug("Claude API stream complete")
     except Exception as e:
-        print(f"Claude API error details: {str(e)}")
+        logger.error("Claude API error details: %s", e)
         raise Exception(f"Claude API error: {str(e)}")
+    finally:
+        release()
+
+
+# Completion budget for recommendations: fixed overhead plus a short per-store analysis
+RECOMMENDATION_BASE_TOKENS = 200
+RECOMMENDATION_TOKENS_PER_STORE = 80
+RECOMMENDATION_MAX_TOKENS = 4000
+
+# Above this many stores recommendations go through the provider Batch API
+BATCH_STORE_THRESHOLD = 5
+
 
+def get_ai_recommendations(stores_data, async_ok=False):
+    """
+    Get AI-powered store recommendations based on EJV scores.
 
-def get_ai_recommendations(stores_data):
-    """Get AI-powered store recommendations based on EJV scores"""
+    All stores go out in a single request as a numbered list and the model
+    answers with one JSON object covering every store, so the system prompt
+    and HTTP round trip are paid once regardless of the number of stores.
+
+    With more than BATCH_STORE_THRESHOLD stores, or async_ok, the request is
+    queued on the Batch API instead and {'status': 'queued', 'batch_id': ...}
+    is returned; poll get_batch_recommendations for the result.
+    """
     try:
         if not stores_data or len(stores_data) == 0:
             return {'error': 'No store data provided'}
         
-        # Analyze stores
-        analysis = analyze_stores(stores_data)
+        # One line per store
+        store_prompts = analyze_stores(stores_data)
+        numbered_stores = "\n".join(f"{i}. {line}" for i, line in enumerate(store_prompts, 1))
         
         # Build prompt for recommendations
-        prompt = f"""Analyze these {len(stores_data)} stores and provide recommendations:
-
-{analysis}
+        prompt = f"""Analyze each of these {len(stores_data)} stores independently:
 
-Provide:
-1. Best store for economic justice (highest EJV)
-2. Store with most local impact
-3. A brief explanation of the key differences
+{numbered_stores}
 
-Keep response concise (3-4 sentences)."""
+Return only a JSON object with these keys:
+- "stores": array with one entry per store, in order, each {{"store": <number>, "name": <name>, "analysis": <one sentence on its economic justice impact>}}
+- "best_store": name of the best store for economic justice (highest EJV)
+- "most_local_impact": name of the store with most local impact
+- "summary": brief explanation of the key differences (2-3 sentences)"""
+        
+        system_prompt = build_system_prompt()
+        context_message = build_context_message({'stores': stores_data})
+        max_tokens = min(
+            RECOMMENDATION_BASE_TOKENS + RECOMMENDATION_TOKENS_PER_STORE * len(stores_data),
+            RECOMMENDATION_MAX_TOKENS
+        )
         
-        system_prompt = build_system_prompt({'stores': stores_data})
+        if async_ok or len(stores_data) > BATCH_STORE_THRESHOLD:
+            return queue_recommendations(system_prompt, context_message, prompt, max_tokens)
         
-        if openai_client:
-            response = get_openai_response(system_prompt, prompt)
-        elif anthropic_client:
-            response = get_claude_response(system_prompt, prompt)
+        if get_openai_client():
+            response = get_openai_response(system_prompt, context_message, prompt,
+                                           max_tokens=max_tokens, json_mode=True)
+        elif get_anthropic_client():
+            response = get_claude_response(system_prompt, context_message, prompt,
+                                           max_tokens=max_tokens)
         else:
             return {'error': 'No AI provider available'}
         
-        return {'recommendations': response}
+        return parse_recommendations(response)
+        
+    except LLMBusyError:
+        raise
+    except Exception as e:
+        return {'error': str(e)}
+
+
+def queue_recommendations(system_prompt, context_message, prompt, max_tokens):
+    """Submit a recommendations request to the OpenAI or Anthropic Batch API"""
+    if get_openai_client():
+        batch_id = batch_recommendations.create_openai_batch(get_openai_client(), {
+            "model": OPENAI_MODEL,
+            "messages": _openai_messages(system_prompt, context_message, prompt),
+            "temperature": CACHEABLE_TEMPERATURE,
+            "max_tokens": max_tokens,
+            "response_format": {"type": "json_object"}
+        })
+    elif get_anthropic_client():
+        system_blocks, messages = _claude_request(system_prompt, context_message, prompt)
+        batch_id = batch_recommendations.create_claude_batch(get_anthropic_client(), {
+            "model": CLAUDE_MODEL,
+            "max_tokens": max_tokens,
+            "temperature": CACHEABLE_TEMPERATURE,
+            "system": system_blocks,
+            "messages": messages
+        })
+    else:
+        return {'error': 'No AI provider available'}
+    
+    return {'status': 'queued', 'batch_id': batch_id}
+
+
+def get_batch_recommendations(batch_id):
+    """Get the status, and once finished the recommendations, of a queued batch"""
+    try:
+        status, response_text = batch_recommendations.get_batch_result(
+            batch_id, get_openai_client(), get_anthropic_client()
+        )
+        if status is None:
+            return {'error': 'Unknown batch id'}
+        if status != batch_recommendations.STATUS_COMPLETED:
+            return {'status': status, 'batch_id': batch_id}
+        
+        result = parse_recommendations(response_text)
+        result.update({'status': status, 'batch_id': batch_id})
+        return result
         
     except Exception as e:
         return {'error': str(e)}
 
 
+def parse_recommendations(response_text):
+    """Turn the model's JSON answer into the recommendations payload"""
+    try:
+        # Claude has no JSON mode and may wrap the object in prose or a code fence
+        start, end = response_text.find('{'), response_text.rfind('}')
+        result = orjson.loads(response_text[start:end + 1])
+    except ValueError:
+        logger.warning("AI recommendations: Response was not valid JSON, returning raw text")
+        return {'recommendations': response_text}
+    
+    return {
+        'recommendations': result.get('summary', ''),
+        'best_store': result.get('best_store'),
+        'most_local_impact': result.get('most_local_impact'),
+        'store_analyses': result.get('stores', [])
+    }
+
+
 def analyze_stores(stores_data):
-    """Create a text summary of stores for AI analysis"""
-    summary = ""
-    for i, store in enumerate(stores_data, 1):
-        summary += f"\nStore {i}: {store.get('name', 'Unknown')}\n"
-        summary += f"  - EJV 4.0: {store.get('ejv40', 'N/A')}\n"
-        summary += f"  - EJV 4.1: {store.get('ejv41', 'N/A')}\n"
-        summary += f"  - Local Circulation: {store.get('localCirculation', 'N/A')}\n"
-        summary += f"  - Wealth Retention: {store.get('wealthRetention', 'N/A')}%\n"
-    return summary
+    """Create one compact prompt line per store for AI analysis"""
+    return [
+        f"{store.get('name', 'Unknown')}: "
+        f"EJV 4.0 {store.get('ejv40', 'N/A')}, "
+        f"EJV 4.1 {store.get('ejv41', 'N/A')}, "
+        f"Local Circulation {store.get('localCirculation', 'N/A')}, "
+        f"Wealth Retention {store.get('wealthRetention', 'N/A')}%"
+        for store in stores_data
+    ]
 
 
 # Export the endpoint function
@@ -222,14 +751,28 @@ def register_ai_routes(app):
     
     @app.route('/api/ai/recommendations', methods=['POST'])
     def recommendations():
-        data = request.json
+        data = request_json()
+        if data is None:
+            return json_response({'error': 'Request body must be a JSON object'}, 400)
         stores = data.get('stores', [])
-        return jsonify(get_ai_recommendations(stores))
+        async_ok = str(data.get('async_ok', request.args.get('async_ok', ''))).lower() == 'true'
+        try:
+            return json_response(get_ai_recommendations(stores, async_ok=async_ok))
+        except LLMBusyError as e:
+            return json_response({'error': str(e)}, 503)
+    
+    @app.route('/api/ai/recommendations/<batch_id>', methods=['GET'])
+    def batch_recommendations_status(batch_id):
+        """Poll a queued Batch API recommendations job"""
+        result = get_batch_recommendations(batch_id)
+        if result.get('error') == 'Unknown batch id':
+            return json_response(result, 404)
+        return json_response(result)
     
     @app.route('/api/ai/status', methods=['GET'])
     def status():
         """Check AI assistant availability"""
-        return jsonify({
-            'openai_available': openai_client is not None,
-            'claude_available': anthropic_client is not None
+        return json_response({
+            'openai_available': bool(os.getenv('OPENAI_API_KEY')),
+            'claude_available': bool(os.getenv('CLAUDE_API_KEY'))
         })
@@ -1,4 +1,6 @@
 
+import os
+import logging
 import requests
 import random
 import hashlib
@@ -7,11 +9,29 @@ import time
 from datetime import datetime, timedelta
 from flask import Flask, jsonify, request, send_file
 from flask_cors import CORS
-from werkzeug.security import check_password_hash
 import database
 from company_data import get_company_data, has_company_data, get_store_type_from_company
 from api.ai_assistant import register_ai_routes
 
+# Configure logging once for the whole app. The root logger stays at INFO so
+# third-party libraries (openai, anthropic, httpx, urllib3) never log request
+# bodies; the app's own loggers run at DEBUG locally, INFO on serverless,
+# unless LOG_LEVEL overrides it. Debug calls are a cheap level check at INFO.
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+)
+APP_LOGGERS = (__name__, 'api', 'database', 'company_data', 'llm_cache',
+               'batch_recommendations', 'rate_limiter')
+APP_LOG_LEVEL = (os.getenv('LOG_LEVEL') or ('INFO' if database.IS_SERVERLESS else 'DEBUG')).upper()
+if APP_LOG_LEVEL not in logging.getLevelNamesMapping():
+    # A typo in LOG_LEVEL shouldn't stop the app from starting
+    logging.getLogger(__name__).warning("Unknown LOG_LEVEL %r, using INFO", os.getenv('LOG_LEVEL'))
+    APP_LOG_LEVEL = 'INFO'
+for _logger_name in APP_LOGGERS:
+    logging.getLogger(_logger_name).setLevel(APP_LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for frontend access
 
@@ -26,9 +46,9 @@ def initialize_database():
         try:
             database.init_database()
             app.db_initialized = True
-            print("Database initialized successfully")
+            logger.info("Database initialized successfully")
         except Exception as e:
-            print(f"Database initialization error: {e}")
+            logger.error("Database initialization error: %s", e)
             # Continue anyway - some endpoints don't need DB
 
 # Cache for API calls to avoid rate limiting
@@ -258,10 +278,10 @@ def get_bls_wage_data(soc_code):
     """
     if soc_code in BLS_WAGE_DATA:
         wage_info = BLS_WAGE_DATA[soc_code]
-        print(f"[OK] BLS OEWS: ${wage_info['wage']}/hr for {wage_info['title']} ({wage_info['updated']})")
+        logger.debug("BLS OEWS: $%s/hr for %s (%s)", wage_info['wage'], wage_info['title'], wage_info['updated'])
         return wage_info["wage"]
     
-    print(f"BLS: No data for SOC {soc_code}, using industry standard")
+    logger.debug("BLS: No data for SOC %s, using industry standard", soc_code)
     return None
 
 # ---------------------------------------
@@ -303,7 +323,7 @@ def get_industry_employee_count(naics_code):
     """
     if naics_code in INDUSTRY_EMPLOYMENT:
         emp_data = INDUSTRY_EMPLOYMENT[naics_code]
-        print(f"[OK] Industry Data: ~{emp_data['avg_employees']} employees for {emp_data['source']}")
+        logger.debug("Industry Data: ~%s employees for %s", emp_data['avg_employees'], emp_data['source'])
         return emp_data["avg_employees"]
     
     return None
@@ -333,17 +353,17 @@ def get_local_economic_indicators(zip_code):
                 # data[0] is headers, data[1] is values
                 unemployment_rate = float(data[1][1]) if data[1][1] and data[1][1] != 'null' else 5.0
                 median_income = int(float(data[1][2])) if data[1][2] and data[1][2] != 'null' else 50000
-                print(f"[OK] Census API: ZIP {zip_code} - Unemployment: {unemployment_rate}%, Income: ${median_income}")
+                logger.debug("Census API: ZIP %s - Unemployment: %s%%, Income: $%s", zip_code, unemployment_rate, median_income)
                 return {
                     'unemployment_rate': unemployment_rate,
                     'median_income': median_income
                 }
         else:
-            print(f"Census API: HTTP {response.status_code}")
+            logger.warning("Census API: HTTP %s", response.status_code)
     except Exception as e:
-        print(f"Census API Error: {e}")
+        logger.warning("Census API Error: %s", e)
     
-    print(f"Census API: Using defaults for ZIP {zip_code}")
+    logger.debug("Census API: Using defaults for ZIP %s", zip_code)
     return {'unemployment_rate': 5.0, 'median_income': 50000}
 
 # ---------------------------------------
@@ -376,7 +396,7 @@ def get_payroll_data(store_id, store_type=None, store_name=None, location=None,
     if company_data:
         # Use company-specific wage data
         avg_wage = company_data["avg_hourly_wage"]
-        print(f"[OK] Using company-specific wage for {store_name}: ${avg_wage}/hr")
+        logger.debug("Using company-specific wage for %s: $%s/hr", store_name, avg_wage)
     else:
         # Get real-time wage data from BLS
         real_wage = get_bls_wage_data(industry_info["soc_code"])
@@ -400,7 +420,7 @@ def get_payroll_data(store_id, store_type=None, store_name=None, location=None,
         avg_wage = round(avg_wage * company_wage_multiplier, 2)
         
         if company_wage_multiplier != 1.0:
-            print(f"[OK] Company wage adjustment: {company_wage_multiplier}x → ${avg_wage}/hr")
+            logger.debug("Company wage adjustment: %sx → $%s/hr", company_wage_multiplier, avg_wage)
     
     # Get industry-standard employee count
     real_employee_count = None
@@ -477,12 +497,12 @@ def get_median_income(state_fips, county_fips, tract_fips):
             data = r.json()
             if len(data) > 1 and data[1][1] and data[1][1] != 'null':
                 income = int(data[1][1])
-                print(f"[OK] Census API: Tract {state_fips}-{county_fips}-{tract_fips} - Income: ${income}")
+                logger.debug("Census API: Tract %s-%s-%s - Income: $%s", state_fips, county_fips, tract_fips, income)
                 return income
     except Exception as e:
-        print(f"Census income API error: {e}")
+        logger.warning("Census income API error: %s", e)
     
-    print(f"Census API: Using default income for tract {tract_fips}")
+    logger.debug("Census API: Using default income for tract %s", tract_fips)
     return 50000  # Default fallback
 
 # ---------------------------------------
@@ -544,7 +564,7 @@ def get_business_size_multiplier(store_name):
     # Check for company-specific data first
     for company_key, company_data in COMPANY_SPECIFIC_DATA.items():
         if company_key in store_name_lower:
-            print(f"[OK] Using company-specific data for {company_key.title()}")
+            logger.debug("Using company-specific data for %s", company_key.title())
             return {
                 'type': 'chain',
                 'company_name': company_key,
@@ -678,7 +698,7 @@ def get_basket_price_data(store_id, zip_code, store_type="supermarket"):
         # No artificial variation - pricing based on store type only
         store_basket_price = city_basket_price * store_multiplier
         
-        print(f"[OK] Basket Pricing: City=${city_basket_price:.2f}, Store=${store_basket_price:.2f} (type: {store_type})")
+        logger.debug("Basket Pricing: City=$%.2f, Store=$%.2f (type: %s)", city_basket_price, store_basket_price, store_type)
         
         return {
             "city_basket_price": round(city_basket_price, 2),
@@ -687,7 +707,7 @@ def get_basket_price_data(store_id, zip_code, store_type="supermarket"):
             "income_adjusted": True
         }
     except Exception as e:
-        print(f"Basket Price Error: {e}")
+        logger.warning("Basket Price Error: %s", e)
         # Return reasonable defaults
         return {
             "city_basket_price": 550.0,
@@ -711,7 +731,7 @@ def get_environmental_data(store_id, store_name=None, store_type="supermarket"):
         # Use company-specific environmental data
         renewable_pct = company_data["renewable_energy_pct"]
         recycling_pct = company_data["recycling_pct"]
-        print(f"[OK] Using company-specific environmental data for {store_name}: Renewable={renewable_pct:.1f}%, Recycling={recycling_pct:.1f}%")
+        logger.debug("Using company-specific environmental data for %s: Renewable=%.1f%%, Recycling=%.1f%%", store_name, renewable_pct, recycling_pct)
     else:
         # Default values based on industry research
         # Source: EPA Green Power Partnership, retail industry averages
@@ -755,9 +775,9 @@ def get_environmental_data(store_id, store_name=None, store_type="supermarket"):
         data_sources = business_multipliers.get('data_sources', ['EPA + Industry Reports'])
         
         if company_name:
-            print(f"[OK] Environmental ({company_name.title()}): Renewable={renewable_pct:.1f}%, Recycling={recycling_pct:.1f}% (multiplier: {env_multiplier}x)")
+            logger.debug("Environmental (%s): Renewable=%.1f%%, Recycling=%.1f%% (multiplier: %sx)", company_name.title(), renewable_pct, recycling_pct, env_multiplier)
         else:
-            print(f"[OK] Environmental: Renewable={renewable_pct:.1f}%, Recycling={recycling_pct:.1f}%")
+            logger.debug("Environmental: Renewable=%.1f%%, Recycling=%.1f%%", renewable_pct, recycling_pct)
     
     return {
         "renewable_energy_percent": round(min(100, renewable_pct), 1),
@@ -780,7 +800,7 @@ def get_equity_data(store_id, store_name=None, store_type="supermarket"):
     if company_data:
         # Use company-specific equity score
         equitable_practices_pct = company_data["equity_score"]
-        print(f"[OK] Using company-specific equity data for {store_name}: {equitable_practices_pct:.1f}%")
+        logger.debug("Using company-specific equity data for %s: %.1f%%", store_name, equitable_practices_pct)
         return {
             "equitable_practices_percent": round(equitable_practices_pct, 1),
             "source": "Company ESG Reports + EEOC Data",
@@ -815,9 +835,9 @@ def get_equity_data(store_id, store_name=None, store_type="supermarket"):
         data_sources = business_multipliers.get('data_sources', ['EEOC + Company ESG Reports'])
         
         if company_name:
-            print(f"[OK] Equity ({company_name.title()}): {equitable_practices_pct:.1f}% (multiplier: {equity_multiplier}x)")
+            logger.debug("Equity (%s): %.1f%% (multiplier: %sx)", company_name.title(), equitable_practices_pct, equity_multiplier)
         else:
-            print(f"[OK] Equity: {equitable_practices_pct:.1f}% equitable practices score")
+            logger.debug("Equity: %.1f%% equitable practices score", equitable_practices_pct)
         
         return {
             "equitable_practices_percent": round(min(100, equitable_practices_pct), 1),
@@ -839,7 +859,7 @@ def get_procurement_data(store_id, store_name=None, store_type="supermarket"):
     if company_data:
         # Use company-specific procurement data
         local_procurement_pct = company_data["local_procurement_pct"]
-        print(f"[OK] Using company-specific procurement data for {store_name}: {local_procurement_pct:.1f}% local sourcing")
+        logger.debug("Using company-specific procurement data for %s: %.1f%% local sourcing", store_name, local_procurement_pct)
         return {
             "local_purchasing_percent": round(min(95, local_procurement_pct), 1),
             "source": "Company Reports + Research"
@@ -867,9 +887,9 @@ def get_procurement_data(store_id, store_name=None, store_type="supermarket"):
     data_sources = business_multipliers.get('data_sources', ['Supply chain research'])
     
     if company_name:
-        print(f"[OK] Procurement ({company_name.title()}): {local_procurement_pct:.1f}% local sourcing")
+        logger.debug("Procurement (%s): %.1f%% local sourcing", company_name.title(), local_procurement_pct)
     else:
-        print(f"[OK] Procurement: {local_procurement_pct:.1f}% local sourcing")
+        logger.debug("Procurement: %.1f%% local sourcing", local_procurement_pct)
     
     return {
         "local_purchasing_percent": round(min(95, local_procurement_pct), 1),
@@ -905,7 +925,7 @@ def calculate_ejv(store_id, store_name=None, location=None, zip_code="10001", st
     - EPA: Environmental data
     - Industry research: Procurement patterns
     """
-    print(f"\n=== Calculating EJV for {store_id} ===")
+    logger.debug("=== Calculating EJV for %s ===", store_id)
     
     # Get store type for industry-specific data
     store_type = get_store_type_from_id(store_id, store_name=store_name)
@@ -967,13 +987,11 @@ def calculate_ejv(store_id, store_name=None, location=None, zip_code="10001", st
     elvr = purchase_amount * ejv_score
     evl = purchase_amount - elvr
     
-    print(f"\n✓ EJV Components:")
-    print(f"  W (Fair Wage): {W:.3f}")
-    print(f"  P (Pay Equity): {P:.3f}")
-    print(f"  L (Local Impact): {L:.3f}")
-    print(f"  A (Affordability): {A:.3f}")
-    print(f"  E (Environmental): {E:.3f}")
-    print(f"  Overall EJV: {ejv_score:.3f}\n")
+    logger.debug(
+        "EJV Components: W (Fair Wage)=%.3f, P (Pay Equity)=%.3f, L (Local Impact)=%.3f, "
+        "A (Affordability)=%.3f, E (Environmental)=%.3f, Overall EJV=%.3f",
+        W, P, L, A, E, ejv_score
+    )
     
     return {
         "store_id": store_id,
@@ -1176,12 +1194,16 @@ def login():
         }), 403
     
     # Verify password
-    if not check_password_hash(user['password_hash'], password):
+    if not database.verify_password(user['password_hash'], password):
         return jsonify({
             "success": False,
             "message": "Invalid username or password"
         }), 401
     
+    # Upgrade legacy werkzeug hashes to Argon2 now that we have the plaintext
+    if database.password_needs_rehash(user['password_hash']):
+        database.update_password_hash(user['id'], password)
+    
     # Create session token
     session_token = secrets.token_urlsafe(32)
     expires_at = datetime.now() + timedelta(days=7)  # Session expires in 7 days
@@ -1241,7 +1263,7 @@ def overpass_proxy():
         if 'out center' in query and not 'out center' in query.split(');')[1]:
             query = query.replace('out center;', 'out center 100;')
         
-        print(f"Optimized query: {query[:150]}...")
+        logger.debug("Optimized query: %s...", query[:150])
         
         # Multiple backup servers with different endpoints (8 servers for better reliability)
         servers = [
@@ -1263,7 +1285,7 @@ def overpass_proxy():
             for retry in range(2):  # 2 attempts per server
                 try:
                     attempt = f"{i+1}/{len(servers)}" + (f" (retry {retry+1})" if retry > 0 else "")
-                    print(f"Trying Overpass server {attempt}: {server}")
+                    logger.debug("Trying Overpass server %s: %s", attempt, server)
                     
                     response = requests.post(
                         server,
@@ -1278,36 +1300,36 @@ def overpass_proxy():
                     if response.status_code == 200:
                         data = response.json()
                         result_count = len(data.get('elements', []))
-                        print(f"[OK] Server {i+1} success: {result_count} results")
+                        logger.debug("Server %s success: %s results", i + 1, result_count)
                         return jsonify(data), 200
                     elif response.status_code == 429:
                         error_msg = "Rate limited"
-                        print(f"[FAIL] Server {i+1} rate limited")
+                        logger.warning("Server %s rate limited", i + 1)
                         last_error = error_msg
                         time.sleep(3)  # Wait longer for rate limit
                     elif response.status_code == 503:
                         error_msg = "Service unavailable (503)"
-                        print(f"[FAIL] Server {i+1} temporarily unavailable (503)")
+                        logger.warning("Server %s temporarily unavailable (503)", i + 1)
                         last_error = error_msg
                         # Continue to next server immediately for 503
                         break
                     elif response.status_code == 504:
                         error_msg = "Gateway timeout - query too complex"
-                        print(f"[FAIL] Server {i+1} timeout: {error_msg}")
+                        logger.warning("Server %s timeout: %s", i + 1, error_msg)
                         last_error = error_msg
                         break  # Don't retry timeouts on same server
                     else:
                         error_msg = f"HTTP {response.status_code}"
-                        print(f"[FAIL] Server {i+1} failed: {error_msg}")
+                        logger.warning("Server %s failed: %s", i + 1, error_msg)
                         last_error = error_msg
                         
                 except requests.Timeout:
-                    print(f"[FAIL] Server {i+1} connection timeout")
+                    logger.warning("Server %s connection timeout", i + 1)
                     last_error = "Connection timeout"
                     break  # Don't retry timeouts
                 except requests.RequestException as e:
                     error_str = str(e)[:100]
-                    print(f"[FAIL] Server {i+1} error: {error_str}")
+                    logger.warning("Server %s error: %s", i + 1, error_str)
                     last_error = error_str
                     if retry == 0:
                         time.sleep(1)  # Brief wait before retry
@@ -1322,7 +1344,7 @@ def overpass_proxy():
                 time.sleep(delay)
         
         # All servers failed - provide helpful message
-        print(f"❌ All {len(servers)} Overpass servers failed. Last error: {last_error}")
+        logger.error("All %s Overpass servers failed. Last error: %s", len(servers), last_error)
         return jsonify({
             "error": "All Overpass servers temporarily unavailable. Try: (1) Reduce radius to 1-2 miles, (2) Wait 30-60 seconds, (3) Different location/category",
             "details": f"Tried {len(servers)} servers. Last error: {last_error}",
@@ -1331,7 +1353,7 @@ def overpass_proxy():
         
     except Exception as e:
         error_msg = str(e)
-        print(f"Overpass proxy error: {error_msg}")
+        logger.error("Overpass proxy error: %s", error_msg)
         return jsonify({
             "error": "Internal error processing request",
             "details": error_msg,
@@ -0,0 +1,168 @@
+"""
+Batch API support for non-interactive AI recommendations
+Queues requests on the OpenAI Batch API / Anthropic Message Batches API
+(half price, outside the synchronous rate limits) and tracks them in SQLite
+"""
+
+import json
+import logging
+import database
+
+logger = logging.getLogger(__name__)
+
+# Single request per batch, so one fixed custom id is enough to find its result
+CUSTOM_ID = "recommendations"
+
+# Batch lifecycle states exposed to API clients
+STATUS_IN_PROGRESS = "in_progress"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+
+OPENAI_FAILED_STATUSES = ("failed", "expired", "cancelling", "cancelled")
+
+
+def create_openai_batch(client, body):
+    """Upload a one-line JSONL file and start an OpenAI chat completions batch"""
+    line = json.dumps({
+        "custom_id": CUSTOM_ID,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": body
+    })
+    batch_file = client.files.create(
+        file=("recommendations.jsonl", line.encode('utf-8')),
+        purpose="batch"
+    )
+    batch = client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    save_batch(batch.id, 'openai')
+    logger.info("Batch API: Queued OpenAI batch %s", batch.id)
+    return batch.id
+
+
+def create_claude_batch(client, params):
+    """Start an Anthropic message batch with a single request"""
+    batch = client.messages.batches.create(
+        requests=[{"custom_id": CUSTOM_ID, "params": params}]
+    )
+    save_batch(batch.id, 'claude')
+    logger.info("Batch API: Queued Claude batch %s", batch.id)
+    return batch.id
+
+
+def save_batch(batch_id, provider):
+    """Record a newly queued (or newly seen) batch"""
+    conn = database.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT OR IGNORE INTO ai_batches (batch_id, provider, status)
+        VALUES (?, ?, ?)
+    ''', (batch_id, provider, STATUS_IN_PROGRESS))
+    conn.commit()
+    database.close_connection(conn)
+
+
+def infer_provider(batch_id):
+    """Provider of a batch id by its prefix, or None if it matches neither"""
+    if batch_id.startswith("msgbatch_"):
+        return 'claude'
+    if batch_id.startswith("batch_"):
+        return 'openai'
+    return None
+
+
+def get_batch(batch_id):
+    """Get a tracked batch by id"""
+    conn = database.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM ai_batches WHERE batch_id = ?', (batch_id,))
+    batch = cursor.fetchone()
+    database.close_connection(conn)
+    return batch
+
+
+def update_batch(batch_id, status, result=None):
+    """Store a batch's final status and response text"""
+    conn = database.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE ai_batches
+        SET status = ?, result = ?, completed_at = CURRENT_TIMESTAMP
+        WHERE batch_id = ?
+    ''', (status, result, batch_id))
+    conn.commit()
+    database.close_connection(conn)
+
+
+def _poll_openai(client, batch_id):
+    """Return (status, response_text) for an OpenAI batch"""
+    batch = client.batches.retrieve(batch_id)
+    if batch.status in OPENAI_FAILED_STATUSES:
+        return STATUS_FAILED, None
+    if batch.status != "completed":
+        return STATUS_IN_PROGRESS, None
+    if not batch.output_file_id:
+        return STATUS_FAILED, None
+
+    output = client.files.content(batch.output_file_id).text
+    for line in output.splitlines():
+        record = json.loads(line)
+        if record.get("custom_id") == CUSTOM_ID and record.get("response"):
+            body = record["response"]["body"]
+            return STATUS_COMPLETED, body["choices"][0]["message"]["content"]
+    return STATUS_FAILED, None
+
+
+def _poll_claude(client, batch_id):
+    """Return (status, response_text) for an Anthropic message batch"""
+    batch = client.messages.batches.retrieve(batch_id)
+    if batch.processing_status != "ended":
+        return STATUS_IN_PROGRESS, None
+
+    for entry in client.messages.batches.results(batch_id):
+        if entry.custom_id == CUSTOM_ID and entry.result.type == "succeeded":
+            return STATUS_COMPLETED, entry.result.message.content[0].text
+    return STATUS_FAILED, None
+
+
+def get_batch_result(batch_id, openai_client, anthropic_client):
+    """
+    Get the (status, response_text) of a batch.
+
+    Finished batches are answered from SQLite; otherwise the provider is
+    polled and the outcome stored once the batch completes or fails. Batches
+    missing from SQLite (e.g. queued by another serverless instance with its
+    own in-memory database) are polled by the provider their id prefix names.
+    Returns (None, None) for an unknown batch id.
+    """
+    batch = get_batch(batch_id)
+    if batch is None:
+        provider = infer_provider(batch_id)
+        if provider is None:
+            return None, None
+    elif batch['status'] != STATUS_IN_PROGRESS:
+        return batch['status'], batch['result']
+    else:
+        provider = batch['provider']
+
+    try:
+        if provider == 'openai' and openai_client:
+            status, result = _poll_openai(openai_client, batch_id)
+        elif provider == 'claude' and anthropic_client:
+            status, result = _poll_claude(anthropic_client, batch_id)
+        else:
+            raise Exception(f"{provider} client not available to poll batch")
+    except Exception as e:
+        # The provider doesn't know the id either
+        if batch is None and getattr(e, 'status_code', None) == 404:
+            return None, None
+        raise
+
+    if batch is None:
+        save_batch(batch_id, provider)
+    if status != STATUS_IN_PROGRESS:
+        update_batch(batch_id, status, result)
+    return status, result
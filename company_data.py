@@ -15,6 +15,13 @@ Data Sources:
 - Supply chain transparency reports
 """
 
+import logging
+import re
+from functools import lru_cache
+import ahocorasick
+
+logger = logging.getLogger(__name__)
+
 # Company-specific data by store name (case-insensitive matching)
 COMPANY_DATA = {
     # === SUPERMARKETS / GROCERY ===
@@ -301,6 +308,94 @@ COMPANY_DATA = {
 }
 
 
+# Numeric company metrics as a structure-of-arrays: one float32 row per company
+# (in COMPANY_DATA order) and one column per field, for vectorized scoring.
+# numpy is only imported, and the matrix only built, on first use
+FEATURE_FIELDS = (
+    "avg_hourly_wage",
+    "local_procurement_pct",
+    "renewable_energy_pct",
+    "recycling_pct",
+    "equity_score",
+    "affordability_multiplier",
+)
+COMPANY_KEYS = tuple(COMPANY_DATA)
+_KEY_INDEX = {key: i for i, key in enumerate(COMPANY_KEYS)}
+
+
+@lru_cache(maxsize=None)
+def _feature_matrix():
+    """Build the (len(COMPANY_KEYS), len(FEATURE_FIELDS)) feature matrix"""
+    import numpy as np
+    return np.array(
+        [[COMPANY_DATA[key][field] for field in FEATURE_FIELDS] for key in COMPANY_KEYS],
+        dtype=np.float32
+    )
+
+
+def score_companies(weights):
+    """
+    Weighted-sum score of every company in one matrix product.
+    
+    Args:
+        weights: Array of len(FEATURE_FIELDS) weights, or a (M, len(FEATURE_FIELDS))
+            matrix to score M weightings (e.g. EJV 4.0/4.1/4.2) at once
+        
+    Returns:
+        np.ndarray: Scores shaped (len(COMPANY_KEYS),) or (len(COMPANY_KEYS), M),
+        rows in COMPANY_KEYS order
+    """
+    import numpy as np
+    weights = np.asarray(weights, dtype=np.float32)
+    return _feature_matrix() @ (weights.T if weights.ndim == 2 else weights)
+
+
+def get_company_features(company_key):
+    """Return the FEATURE_FIELDS row for a company key, or None"""
+    index = _KEY_INDEX.get(company_key)
+    return None if index is None else _feature_matrix()[index]
+
+
+# Single-pass substring matcher over all company keys
+_COMPANY_MATCHER = ahocorasick.Automaton()
+for _company_index, _company_key in enumerate(COMPANY_DATA):
+    # Store the dict position so matches can be ranked like the original dict scan
+    _COMPANY_MATCHER.add_word(_company_key, (_company_index, _company_key))
+_COMPANY_MATCHER.make_automaton()
+
+# All keys joined in dict order, for finding the first key that contains a name
+_KEY_SEPARATOR = "\n"
+_COMPANY_KEYS_TEXT = _KEY_SEPARATOR.join(COMPANY_DATA)
+
+
+# One or more common trailing suffixes: Supercenter, Marketplace, Store, Grocery,
+# Supermarket, Market, etc., plus store numbers like "#123" / "No.5"
+_SUFFIX_RE = re.compile(
+    r'(?:\s+(?:supercenter|marketplace|store|grocery|supermarket|market|shop|food'
+    r'|center|retail|location|#\S*|no\.\S*|branch))+\s*$',
+    re.IGNORECASE
+)
+
+
+def _find_company_in_name(name):
+    """Return the first company key (in dict order) that appears inside name, or None"""
+    # iter() yields matches by position in name, so pick the earliest dict entry
+    match = min(_COMPANY_MATCHER.iter(name), key=lambda m: m[1][0], default=None)
+    return match[1][1] if match else None
+
+
+def _find_company_containing(name):
+    """Return the first company key (in dict order) that contains name, or None"""
+    if not name or _KEY_SEPARATOR in name:
+        return None
+    pos = _COMPANY_KEYS_TEXT.find(name)
+    if pos < 0:
+        return None
+    start = _COMPANY_KEYS_TEXT.rfind(_KEY_SEPARATOR, 0, pos) + 1
+    end = _COMPANY_KEYS_TEXT.find(_KEY_SEPARATOR, pos)
+    return _COMPANY_KEYS_TEXT[start:end if end >= 0 else None]
+
+
 def get_company_data(store_name):
     """
     Get company-specific data for a store.
@@ -313,51 +408,47 @@ def get_company_data(store_name):
         dict: Company data or None
     """
     if not store_name:
-        print("❌ [DEBUG] get_company_data: No store_name provided")
+        logger.debug("get_company_data: No store_name provided")
         return None
     
     # Normalize store name for matching
-    store_name_lower = store_name.lower().strip()
-    print(f"[DEBUG] get_company_data: Looking for '{store_name}' (normalized: '{store_name_lower}')")
+    return _get_company_data_cached(store_name.lower().strip())
+
+
+# COMPANY_DATA is constant, so lookups never need invalidating
+@lru_cache(maxsize=4096)
+def _get_company_data_cached(store_name_lower):
+    """Match a normalized store name against COMPANY_DATA"""
+    logger.debug("get_company_data: Looking for '%s'", store_name_lower)
     
     # Direct match
     if store_name_lower in COMPANY_DATA:
-        print(f"[DEBUG] ✓ Found direct match for '{store_name_lower}'")
+        logger.debug("Found direct match for '%s'", store_name_lower)
         return COMPANY_DATA[store_name_lower]
     
     # Partial match (e.g., "Walmart Supercenter" matches "walmart")
-    for company_key in COMPANY_DATA.keys():
-        if company_key in store_name_lower:
-            print(f"[DEBUG] ✓ Found partial match: '{company_key}' in '{store_name_lower}'")
-            return COMPANY_DATA[company_key]
+    company_key = _find_company_in_name(store_name_lower)
+    if company_key:
+        logger.debug("Found partial match: '%s' in '%s'", company_key, store_name_lower)
+        return COMPANY_DATA[company_key]
     
-    # Try removing common suffixes and try again
-    # Remove: Supercenter, Marketplace, Store, Grocery, Supermarket, Market, etc.
-    common_suffixes = [
-        ' supercenter', ' marketplace', ' store', ' grocery', ' supermarket', 
-        ' market', ' shop', ' food', ' center', ' retail', ' location',
-        ' #', ' no.', ' branch'
-    ]
-    
-    cleaned_name = store_name_lower
-    for suffix in common_suffixes:
-        if suffix in cleaned_name:
-            cleaned_name = cleaned_name.split(suffix)[0].strip()
+    # Try removing common trailing suffixes and try again
+    cleaned_name = _SUFFIX_RE.sub('', store_name_lower).strip()
     
     # If we cleaned the name, try matching again
     if cleaned_name != store_name_lower:
-        print(f"[DEBUG] Trying cleaned name: '{cleaned_name}'")
+        logger.debug("Trying cleaned name: '%s'", cleaned_name)
         if cleaned_name in COMPANY_DATA:
-            print(f"[DEBUG] ✓ Found match after cleaning: '{cleaned_name}'")
+            logger.debug("Found match after cleaning: '%s'", cleaned_name)
             return COMPANY_DATA[cleaned_name]
         
-        # Try partial match on cleaned name
-        for company_key in COMPANY_DATA.keys():
-            if company_key in cleaned_name or cleaned_name in company_key:
-                print(f"[DEBUG] ✓ Found partial match after cleaning: '{company_key}' ~ '{cleaned_name}'")
-                return COMPANY_DATA[company_key]
+        # Try partial match on cleaned name (either direction)
+        company_key = _find_company_in_name(cleaned_name) or _find_company_containing(cleaned_name)
+        if company_key:
+            logger.debug("Found partial match after cleaning: '%s' ~ '%s'", company_key, cleaned_name)
+            return COMPANY_DATA[company_key]
     
-    print(f"[DEBUG] ✗ No match found for '{store_name_lower}'. Available companies: {list(COMPANY_DATA.keys())[:10]}...")
+    logger.debug("No match found for '%s'", store_name_lower)
     return None
 
 
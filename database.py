@@ -1,19 +1,68 @@
 import sqlite3
+import logging
+import queue
 from datetime import datetime
-from werkzeug.security import generate_password_hash
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 import os
 
+logger = logging.getLogger(__name__)
+
 # Use in-memory database for serverless environments (Vercel)
 # This will be ephemeral but works for demo purposes
 IS_SERVERLESS = os.environ.get('VERCEL', False) or os.environ.get('AWS_LAMBDA_FUNCTION_NAME', False)
 DATABASE_NAME = ':memory:' if IS_SERVERLESS else 'fixapp.db'
 
+# Argon2id password hashing (memory-hard, cheaper per verify than werkzeug's PBKDF2/scrypt)
+_password_hasher = PasswordHasher(time_cost=2, memory_cost=65536, parallelism=2)
+
+def hash_password(password):
+    """Hash a password for storage"""
+    return _password_hasher.hash(password)
+
+def verify_password(password_hash, password):
+    """Check a password against a stored Argon2 or legacy werkzeug hash"""
+    if not password_hash.startswith('$argon2'):
+        return check_password_hash(password_hash, password)
+    try:
+        return _password_hasher.verify(password_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+def password_needs_rehash(password_hash):
+    """True for legacy werkzeug hashes or Argon2 hashes with outdated parameters"""
+    if not password_hash.startswith('$argon2'):
+        return True
+    return _password_hasher.check_needs_rehash(password_hash)
+
 # Global in-memory database connection for serverless
 _in_memory_conn = None
 
+# Shared pool of persistent file database connections for local. Werkzeug's
+# threaded server starts a new thread per request, so connections are handed
+# back here instead of being tied to a thread
+POOL_SIZE = 8
+_connection_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+
+def _open_file_connection():
+    """Open a file-based connection in autocommit mode with WAL, so short
+    queries skip open/journal overhead"""
+    conn = sqlite3.connect(DATABASE_NAME, check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-64000")  # 64 MB page cache
+    conn.execute("PRAGMA busy_timeout=5000")  # Wait for other writers instead of failing
+    return conn
+
 def close_connection(conn):
-    """Close connection only if not in-memory"""
-    if not IS_SERVERLESS and conn:
+    """Return a connection to the pool (closing it if the pool is full)"""
+    if IS_SERVERLESS:
+        return
+    try:
+        _connection_pool.put_nowait(conn)
+    except queue.Full:
         conn.close()
 
 def get_db_connection():
@@ -29,10 +78,11 @@ def get_db_connection():
             init_database_tables(_in_memory_conn)
         return _in_memory_conn
     else:
-        # Use file-based database for local
-        conn = sqlite3.connect(DATABASE_NAME)
-        conn.row_factory = sqlite3.Row
-        return conn
+        # Reuse a pooled connection; open a new one when all are checked out
+        try:
+            return _connection_pool.get_nowait()
+        except queue.Empty:
+            return _open_file_connection()
 
 def init_database_tables(conn):
     """Initialize database tables on given connection"""
@@ -64,19 +114,81 @@ def init_database_tables(conn):
         )
     ''')
     
+    # Covering index so session lookups are answered from the index alone
+    # (users.username/email are UNIQUE and already have implicit indexes)
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sessions_token_exp
+        ON sessions (session_token, expires_at, user_id)
+    ''')
+    
+    # Create semantic cache table for AI assistant responses
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            embedding BLOB NOT NULL,
+            prompt_hash TEXT NOT NULL,
+            context_hash TEXT NOT NULL,
+            conv_hash TEXT NOT NULL,
+            standalone INTEGER DEFAULT 0,
+            response TEXT NOT NULL,
+            provider TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_llm_cache_context
+        ON llm_cache (context_hash, provider, id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_llm_cache_prompt
+        ON llm_cache (prompt_hash, context_hash, provider)
+    ''')
+
+    # Create chat history table so the semantic cache can verify context chains
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ai_conversation_turns (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_conversation_turns
+        ON ai_conversation_turns (conversation_id, id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_conversation_turns_created
+        ON ai_conversation_turns (created_at)
+    ''')
+
+    # Create table tracking queued Batch API recommendation jobs
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ai_batches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            batch_id TEXT UNIQUE NOT NULL,
+            provider TEXT NOT NULL,
+            status TEXT NOT NULL,
+            result TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_at TIMESTAMP
+        )
+    ''')
+
     # Check if demo user exists, if not create it
     cursor.execute("SELECT COUNT(*) FROM users WHERE username = ?", ('admin',))
     if cursor.fetchone()[0] == 0:
         # Create demo admin user (password: fix123)
-        demo_password_hash = generate_password_hash('fix123')
+        demo_password_hash = hash_password('fix123')
         cursor.execute('''
             INSERT INTO users (username, email, password_hash, full_name)
             VALUES (?, ?, ?, ?)
         ''', ('admin', 'admin@fixapp.com', demo_password_hash, 'Demo Admin'))
-        print("✓ Demo admin user created (username: admin, password: fix123)")
+        logger.info("Demo admin user created (username: admin, password: fix123)")
     
     conn.commit()
-    print("Database tables initialized successfully")
+    logger.info("Database tables initialized successfully")
 
 def init_database():
     """Initialize the database with required tables"""
@@ -84,14 +196,14 @@ def init_database():
         # For serverless, connection is already initialized in get_db_connection()
         # Just ensure it's been called once
         get_db_connection()
-        print("In-memory database ready for serverless")
+        logger.info("In-memory database ready for serverless")
     else:
         # For local file-based database
         conn = get_db_connection()
         init_database_tables(conn)
         conn.commit()
         close_connection(conn)
-        print("File-based database initialized")
+        logger.info("File-based database initialized")
 
 def create_user(username, email, password, full_name=None):
     """Create a new user"""
@@ -99,7 +211,7 @@ def create_user(username, email, password, full_name=None):
     cursor = conn.cursor()
     
     try:
-        password_hash = generate_password_hash(password)
+        password_hash = hash_password(password)
         cursor.execute('''
             INSERT INTO users (username, email, password_hash, full_name)
             VALUES (?, ?, ?, ?)
@@ -142,6 +254,18 @@ def update_last_login(user_id):
     conn.commit()
     close_connection(conn)
 
+def update_password_hash(user_id, password):
+    """Re-hash and store a user's password (upgrades legacy hashes on login)"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE users 
+        SET password_hash = ? 
+        WHERE id = ?
+    ''', (hash_password(password), user_id))
+    conn.commit()
+    close_connection(conn)
+
 def create_session(user_id, session_token, expires_at):
     """Create a new session"""
     conn = get_db_connection()
@@ -154,18 +278,36 @@ def create_session(user_id, session_token, expires_at):
     close_connection(conn)
 
 def get_session(session_token):
-    """Get session by token"""
+    """Get session by token (with the owning user's details)"""
     conn = get_db_connection()
     cursor = conn.cursor()
+    # Two index seeks instead of a JOIN; INDEXED BY because the planner would
+    # otherwise pick the non-covering UNIQUE index on session_token
     cursor.execute('''
-        SELECT s.*, u.username, u.email, u.full_name
-        FROM sessions s
-        JOIN users u ON s.user_id = u.id
-        WHERE s.session_token = ? AND s.expires_at > CURRENT_TIMESTAMP
+        SELECT user_id, expires_at FROM sessions INDEXED BY idx_sessions_token_exp
+        WHERE session_token = ? AND expires_at > CURRENT_TIMESTAMP
     ''', (session_token,))
     session = cursor.fetchone()
+    if session is None:
+        close_connection(conn)
+        return None
+    
+    cursor.execute('''
+        SELECT username, email, full_name FROM users WHERE id = ?
+    ''', (session['user_id'],))
+    user = cursor.fetchone()
     close_connection(conn)
-    return session
+    if user is None:
+        return None
+    
+    return {
+        'user_id': session['user_id'],
+        'session_token': session_token,
+        'expires_at': session['expires_at'],
+        'username': user['username'],
+        'email': user['email'],
+        'full_name': user['full_name']
+    }
 
 def delete_session(session_token):
     """Delete a session (logout)"""
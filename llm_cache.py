@@ -0,0 +1,317 @@
+"""
+Semantic response cache for the FIX$ AI Assistant
+Reuses answers for semantically equivalent questions asked in the same context
+and, for follow-up questions, the same conversation chain
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+import database
+
+logger = logging.getLogger(__name__)
+
+# Cosine similarity above which two questions are treated as the same
+SIMILARITY_THRESHOLD = 0.92
+
+# Prior user/assistant exchanges that make up a conversation's context chain
+CONTEXT_CHAIN_TURNS = 3
+
+# Cache bounds: entries per (context, provider) bucket, number of buckets and
+# entry age; the oldest entries / least recently used buckets are evicted first
+MAX_ENTRIES_PER_CONTEXT = 64
+MAX_CONTEXTS = 128
+CACHE_TTL_SECONDS = 7 * 24 * 3600
+
+# Conversations idle for longer than this are pruned from ai_conversation_turns
+CONVERSATION_TTL = '-1 day'
+
+# Follow-up classifier: once a conversation has earlier turns, very short
+# messages ("why?", "and Kroger?"), messages opening like a follow-up ("what
+# about Target?") and messages containing one of the words below ("explain
+# more", "why is that?") lean on those turns and are not standalone
+SHORT_MESSAGE_WORDS = 3
+FOLLOW_UP_OPENERS = frozenset((
+    "and", "but", "so", "or", "then", "why", "how come",
+    "what about", "how about", "what if", "compared",
+))
+FOLLOW_UP_WORDS = frozenset((
+    "it", "its", "it's", "that", "this", "these", "those", "they", "them",
+    "their", "he", "she", "his", "her", "one", "ones", "there",
+    "more", "else", "again", "also", "above", "previous", "same", "other",
+))
+
+
+def normalize_message(message):
+    """Lowercase and collapse whitespace so trivial variations share a key"""
+    return " ".join(message.lower().split())
+
+
+def hash_text(text):
+    """Short stable hash of a string"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def hash_context(context):
+    """Stable hash of the request context (store, scores, location, ...)"""
+    return hash_text(json.dumps(context or {}, sort_keys=True, default=str))
+
+
+def is_standalone(message, has_history=True):
+    """Cheap classifier: False for messages that may refer back to earlier turns"""
+    if not has_history:
+        return True
+    words = [word.strip("?!.,;:\"'()") for word in normalize_message(message).split()]
+    if len(words) <= SHORT_MESSAGE_WORDS:
+        return False
+    if words[0] in FOLLOW_UP_OPENERS or " ".join(words[:2]) in FOLLOW_UP_OPENERS:
+        return False
+    return not any(word in FOLLOW_UP_WORDS for word in words)
+
+
+def record_exchange(conversation_id, user_message, response):
+    """Append a user/assistant exchange to a conversation and prune old turns"""
+    conn = database.get_db_connection()
+    cursor = conn.cursor()
+    cursor.executemany('''
+        INSERT INTO ai_conversation_turns (conversation_id, role, content)
+        VALUES (?, ?, ?)
+    ''', ((conversation_id, 'user', user_message), (conversation_id, 'assistant', response)))
+    # Only the last CONTEXT_CHAIN_TURNS exchanges are ever read back
+    cursor.execute('''
+        DELETE FROM ai_conversation_turns
+        WHERE conversation_id = ? AND id NOT IN (
+            SELECT id FROM ai_conversation_turns
+            WHERE conversation_id = ?
+            ORDER BY id DESC
+            LIMIT ?
+        )
+    ''', (conversation_id, conversation_id, CONTEXT_CHAIN_TURNS * 2))
+    cursor.execute('''
+        DELETE FROM ai_conversation_turns WHERE created_at < datetime('now', ?)
+    ''', (CONVERSATION_TTL,))
+    conn.commit()
+    database.close_connection(conn)
+
+
+def get_recent_turns(conversation_id, turns=CONTEXT_CHAIN_TURNS):
+    """The last `turns` user/assistant exchanges of a conversation as ((role, content), ...), oldest first"""
+    conn = database.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT role, content FROM ai_conversation_turns
+        WHERE conversation_id = ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (conversation_id, turns * 2))
+    rows = cursor.fetchall()
+    database.close_connection(conn)
+    return tuple((row['role'], row['content']) for row in reversed(rows))
+
+
+def hash_conversation(history):
+    """Hash of a conversation's recent turns (see get_recent_turns)"""
+    chain = [[role, normalize_message(content)] for role, content in history]
+    return hash_text(json.dumps(chain))
+
+
+class _ContextBucket:
+    """
+    Cached entries sharing one (context hash, provider) key.
+
+    Rows live in preallocated numpy arrays that double in size up to
+    MAX_ENTRIES_PER_CONTEXT; after that the bucket is a ring buffer and each
+    insert overwrites the oldest entry.
+    """
+
+    def __init__(self, dim):
+        import numpy as np
+        capacity = min(4, MAX_ENTRIES_PER_CONTEXT)
+        self.size = 0
+        self.next_slot = 0
+        self.matrix = np.empty((capacity, dim), dtype=np.float32)
+        self.conv_hashes = np.empty(capacity, dtype='S64')
+        self.standalone = np.zeros(capacity, dtype=bool)
+        self.created = np.zeros(capacity, dtype=np.float64)
+        self.responses = [None] * capacity
+
+    def _grow(self):
+        import numpy as np
+        capacity = min(len(self.responses) * 2, MAX_ENTRIES_PER_CONTEXT)
+        extra = capacity - len(self.responses)
+        self.matrix = np.concatenate(
+            [self.matrix, np.empty((extra, self.matrix.shape[1]), dtype=np.float32)])
+        self.conv_hashes = np.concatenate([self.conv_hashes, np.empty(extra, dtype='S64')])
+        self.standalone = np.concatenate([self.standalone, np.zeros(extra, dtype=bool)])
+        self.created = np.concatenate([self.created, np.zeros(extra, dtype=np.float64)])
+        self.responses.extend([None] * extra)
+
+    def add(self, embedding, conv_hash, standalone, response, created):
+        if self.next_slot == len(self.responses) and self.size < MAX_ENTRIES_PER_CONTEXT:
+            self._grow()
+        slot = self.next_slot % len(self.responses)
+        self.matrix[slot] = embedding
+        self.conv_hashes[slot] = conv_hash.encode('ascii')
+        self.standalone[slot] = standalone
+        self.created[slot] = created
+        self.responses[slot] = response
+        self.next_slot = slot + 1
+        self.size = min(self.size + 1, len(self.responses))
+
+    def best_match(self, embedding, conv_hash, standalone, threshold):
+        """Return (similarity, response) of the best verified entry above threshold, or None"""
+        import numpy as np
+        n = self.size
+        mask = self.conv_hashes[:n] == conv_hash.encode('ascii')
+        if standalone:
+            mask |= self.standalone[:n]
+        mask &= self.created[:n] > time.time() - CACHE_TTL_SECONDS
+        if not mask.any():
+            return None
+
+        scores = np.where(mask, self.matrix[:n] @ embedding, -1.0)
+        best = int(np.argmax(scores))
+        if scores[best] > threshold:
+            return float(scores[best]), self.responses[best]
+        return None
+
+
+class SemanticCache:
+    """
+    Embedding-similarity cache backed by the llm_cache SQLite table.
+
+    Exact repeats are answered from the prompt_hash column by lookup_exact()
+    without an embeddings call. Otherwise entries are bucketed by context hash
+    and provider, so the same question about two different stores never
+    shares an answer and a lookup is one small matrix-vector product over a
+    single bucket. Either kind of hit additionally
+    requires the context chain to be verified: the conversation hash must
+    match unless both the query and the cached entry are standalone.
+    Otherwise a follow-up like "explain more" would hit any earlier
+    "explain more" regardless of topic.
+    """
+
+    def __init__(self, embed_fn, threshold=SIMILARITY_THRESHOLD):
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._buckets = OrderedDict()
+
+    def _add(self, embedding, context_hash, provider, conv_hash, standalone, response, created):
+        """Insert an entry into its bucket, evicting the least recently used bucket when full"""
+        key = (context_hash, provider)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _ContextBucket(len(embedding))
+            if len(self._buckets) > MAX_CONTEXTS:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        bucket.add(embedding, conv_hash, standalone, response, created)
+
+    def _load(self):
+        """Drop expired rows from SQLite and load the rest into memory"""
+        import numpy as np
+        conn = database.get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            DELETE FROM llm_cache WHERE created_at < datetime('now', ?)
+        ''', (f'-{CACHE_TTL_SECONDS} seconds',))
+        conn.commit()
+        cursor.execute('''
+            SELECT embedding, context_hash, conv_hash, standalone, response, provider,
+                   CAST(strftime('%s', created_at) AS REAL) AS created
+            FROM llm_cache ORDER BY id
+        ''')
+        rows = cursor.fetchall()
+        database.close_connection(conn)
+
+        for row in rows:
+            self._add(np.frombuffer(row['embedding'], dtype=np.float32), row['context_hash'],
+                      row['provider'], row['conv_hash'], bool(row['standalone']),
+                      row['response'], row['created'])
+        self._loaded = True
+        logger.debug("Semantic cache: Loaded %s cached responses", len(rows))
+
+    def embed(self, user_message):
+        """Return the unit-length float32 embedding of a normalized message"""
+        import numpy as np
+        vector = np.asarray(self.embed_fn(normalize_message(user_message)), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup_exact(self, user_message, context_hash, conv_hash, standalone, provider):
+        """Return the cached response for the same normalized question in the same context chain, or None"""
+        conn = database.get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT response FROM llm_cache
+            WHERE prompt_hash = ? AND context_hash = ? AND provider = ?
+              AND (conv_hash = ? OR (? AND standalone = 1))
+              AND created_at > datetime('now', ?)
+            ORDER BY id DESC
+            LIMIT 1
+        ''', (hash_text(normalize_message(user_message)), context_hash, provider,
+              conv_hash, int(standalone), f'-{CACHE_TTL_SECONDS} seconds'))
+        row = cursor.fetchone()
+        database.close_connection(conn)
+        if row is None:
+            return None
+        logger.debug("Semantic cache: Exact hit")
+        return row['response']
+
+    def lookup(self, embedding, context_hash, conv_hash, standalone, provider):
+        """Return the cached response for a similar question in the same context chain, or None"""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            bucket = self._buckets.get((context_hash, provider))
+            if bucket is None:
+                return None
+            self._buckets.move_to_end((context_hash, provider))
+            match = bucket.best_match(embedding, conv_hash, standalone, self.threshold)
+        if match is None:
+            return None
+        logger.debug("Semantic cache: Hit (similarity %.3f)", match[0])
+        return match[1]
+
+    def store(self, embedding, user_message, context_hash, conv_hash, standalone, response, provider):
+        """Persist a new response, prune old rows and add it to the in-memory index"""
+        import numpy as np
+        embedding = np.asarray(embedding, dtype=np.float32)
+        conn = database.get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO llm_cache
+                (embedding, prompt_hash, context_hash, conv_hash, standalone, response, provider)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (embedding.tobytes(), hash_text(normalize_message(user_message)),
+              context_hash, conv_hash, int(standalone), response, provider))
+        # Keep SQLite within the same bounds as the in-memory index
+        cursor.execute('''
+            DELETE FROM llm_cache
+            WHERE context_hash = ? AND provider = ? AND id NOT IN (
+                SELECT id FROM llm_cache
+                WHERE context_hash = ? AND provider = ?
+                ORDER BY id DESC
+                LIMIT ?
+            )
+        ''', (context_hash, provider, context_hash, provider, MAX_ENTRIES_PER_CONTEXT))
+        cursor.execute('''
+            DELETE FROM llm_cache WHERE id <= (
+                SELECT id FROM llm_cache ORDER BY id DESC LIMIT 1 OFFSET ?
+            )
+        ''', (MAX_CONTEXTS * MAX_ENTRIES_PER_CONTEXT,))
+        conn.commit()
+        database.close_connection(conn)
+
+        with self._lock:
+            if not self._loaded:
+                # Row is already in SQLite; the first lookup will pick it up
+                return
+            self._add(embedding, context_hash, provider, conv_hash, standalone,
+                      response, time.time())
@@ -0,0 +1,56 @@
+"""
+Proactive rate limiting for AI provider calls
+Keeps request and token dispatch under the account's RPM/TPM limits instead of
+waiting for 429 responses and SDK retries
+"""
+
+import threading
+import time
+
+
+def estimate_tokens(text, max_tokens):
+    """Rough token estimate for a call: ~4 characters per prompt token plus the completion budget"""
+    return len(text) // 4 + max_tokens
+
+
+class TokenBucket:
+    """
+    Dual request/token bucket refilled continuously from time.monotonic().
+
+    acquire() blocks the calling thread until both one request slot and the
+    estimated number of tokens are available. An rpm or tpm of 0 (or less)
+    leaves that dimension unlimited.
+    """
+
+    def __init__(self, rpm, tpm):
+        self.rpm = max(float(rpm), 0.0)
+        self.tpm = max(float(tpm), 0.0)
+        self._requests = self.rpm
+        self._tokens = self.tpm
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+
+    def acquire(self, tokens):
+        """Block until a request slot and `tokens` tokens are available, then consume them"""
+        if not self.rpm and not self.tpm:
+            return
+        # A single call larger than the whole bucket can only wait for a full bucket
+        tokens = min(float(tokens), self.tpm) if self.tpm else 0.0
+        requests = 1.0 if self.rpm else 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._requests >= requests and self._tokens >= tokens:
+                    self._requests -= requests
+                    self._tokens -= tokens
+                    return
+                request_wait = max(0.0, requests - self._requests) * 60.0 / self.rpm if self.rpm else 0.0
+                token_wait = max(0.0, tokens - self._tokens) * 60.0 / self.tpm if self.tpm else 0.0
+            time.sleep(max(request_wait, token_wait))